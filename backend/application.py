@@ -1,17 +1,33 @@
 import os
 import sys
 import base64
+import hashlib
 import logging
-from flask import Flask, request, jsonify, send_from_directory
-from flask_cors import CORS
-import requests
+import logging.handlers
+import queue
+import atexit
+import asyncio
+import email.utils
+from quart import Quart, Response, request, jsonify, send_from_directory
+from quart_cors import cors
+import aiohttp
 from dotenv import load_dotenv
 import time
 import json
-from rag_helper import load_and_chunk_data, build_index, retrieve
+import re
+import threading
+import weakref
+import functools
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from rag_helper import load_and_chunk_data, build_index, retrieve, embed_query
+import response_cache
 from pydub import AudioSegment
 import io
-from sarvamai import SarvamAI
+import wave
+import numpy as np
+import soundfile as sf
+from sarvamai import AsyncSarvamAI
 
 # --- Load environment variables ---
 dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
@@ -19,9 +35,8 @@ if not os.path.exists(dotenv_path):
     print(f"Warning: .env file not found at {dotenv_path}. API keys might not be loaded.", file=sys.stderr)
 load_dotenv(dotenv_path)
 
-# --- Flask app setup ---
-app = Flask(__name__)
-CORS(app)
+# --- Quart app setup ---
+app = cors(Quart(__name__), allow_origin="*")
 
 # --- Configuration ---
 SARVAM_API_KEY = os.getenv('SARVAM_API_KEY')
@@ -29,21 +44,108 @@ OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
 SARVAM_ASR_URL = 'https://api.sarvam.ai/speech-to-text'
 SARVAM_TTS_URL = 'https://api.sarvam.ai/text-to-speech'
 OPENROUTER_CHAT_URL = 'https://openrouter.ai/api/v1/chat/completions'
+LLM_MODEL = "google/gemini-2.0-flash-001"
+SUMMARY_MODEL = "google/gemini-2.0-flash-lite-001"
 DATA_FILE_PATH = os.path.join(os.path.dirname(__file__), '..', 'data.txt')
+TTS_MAX_CONCURRENCY = 8
+TTS_MAX_RETRIES = 4
+TTS_RETRY_BASE_DELAY = 0.5
+HTTP_MAX_RETRIES = 3
+HTTP_RETRY_BASE_DELAY = 0.3
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+
+# --- Shared HTTP session: keeps TLS connections to Sarvam/OpenRouter alive across requests ---
+# Created once the event loop is running (see open_http_session)
+http_session = None
+
+@app.before_serving
+async def open_http_session():
+    global http_session
+    http_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=64, ttl_dns_cache=300))
+
+@app.after_serving
+async def close_http_session():
+    await http_session.close()
+
+# --- Shared HTTP: POST, retrying connection errors, timeouts, rate limits and server errors with backoff ---
+# make_form builds a fresh aiohttp.FormData per attempt, since one can't be re-sent.
+# A Retry-After header on a retryable response overrides the backoff if it asks for longer.
+async def post_with_retry(url, headers, json_body=None, make_form=None, timeout=None):
+    # Without a timeout of its own, a request keeps the session's default
+    extra = {'timeout': aiohttp.ClientTimeout(total=timeout)} if timeout else {}
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        delay = HTTP_RETRY_BASE_DELAY * 2 ** attempt
+        try:
+            response = await http_session.post(
+                url,
+                headers=headers,
+                json=json_body,
+                data=make_form() if make_form else None,
+                **extra
+            )
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if attempt == HTTP_MAX_RETRIES:
+                raise
+            logging.warning("POST %s failed (%r), retrying in %.1f seconds", url, e, delay)
+        else:
+            if response.status not in RETRYABLE_STATUS_CODES or attempt == HTTP_MAX_RETRIES:
+                return response
+            response.release()
+            delay = max(delay, retry_after_seconds(response))
+            logging.warning("POST %s failed with status %s, retrying in %.1f seconds", url, response.status, delay)
+        await asyncio.sleep(delay)
+
+# --- Shared HTTP: Seconds to wait from a Retry-After header (delta-seconds or HTTP date), 0 if absent ---
+def retry_after_seconds(response):
+    value = response.headers.get('Retry-After')
+    if not value:
+        return 0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0
+
+# --- Sarvam SDK client, shared by all TTS calls ---
+sarvam_client = AsyncSarvamAI(api_subscription_key=SARVAM_API_KEY)
+
+# --- Worker pool for blocking CPU work (audio decoding, embeddings), kept off the event loop ---
+executor = ThreadPoolExecutor(max_workers=8)
+
+# --- Background tasks (history summaries); referenced here so they aren't garbage-collected ---
+background_tasks = set()
 
 # --- RAG: Build index at startup ---
-rag_chunks, rag_embeddings = build_index(load_and_chunk_data(DATA_FILE_PATH))
+rag_chunks, rag_index = build_index(load_and_chunk_data(DATA_FILE_PATH))
+
+# --- RAG: Knowledge base context for a query, memoized per exact query text ---
+@functools.lru_cache(maxsize=256)
+def get_rag_context(query):
+    return "\n\n".join(retrieve(query, rag_chunks, rag_index, top_k=5))
 
 # --- Logging ---
+# Request code only enqueues records; a background listener thread writes them
+# to stdout and the log file, so disk writes never block a request.
 log_file_path = os.path.join(os.path.dirname(__file__), 'output.log')
+log_queue = queue.Queue(-1)
+log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+log_handlers = [
+    logging.StreamHandler(sys.stdout),
+    logging.FileHandler(log_file_path, mode='a', encoding='utf-8')
+]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers)
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler(log_file_path, mode='a', encoding='utf-8')
-    ]
+    handlers=[logging.handlers.QueueHandler(log_queue)]
 )
+log_listener.start()
+atexit.register(log_listener.stop)
 
 # --- System Prompt ---
 YOUR_APP_NAME = "Magic Bricks"
@@ -84,66 +186,196 @@ Hinglish. The pronunciation of BHK is 'bee-etch-kay'.
 It is mandatory that you follow all the given instructions diligently and you will be highly rewarded for it.
 """
 
-# --- In-memory conversation history ---
-conversation_history = []
+# --- In-memory conversation history, per browser session ---
+# Each session keeps only its most recent messages; once it would exceed
+# HISTORY_MAX_MESSAGES the oldest HISTORY_EVICT_MESSAGES are folded into a running
+# summary (in the background) that is sent as part of the system prompt instead.
+# Evicted messages are still sent until a summary covering them has been written,
+# so a slow or failed summary call never drops context.
+HISTORY_MAX_MESSAGES = 20
+HISTORY_EVICT_MESSAGES = 10
+MAX_SESSIONS = 256
+SUMMARY_PROMPT = """
+Summarize this conversation between a home buyer and Raj, a real-estate voice assistant, in at most 5 short sentences.
+Keep every stated preference (budget, BHK count, locality, amenities) and every property already suggested.
+"""
+conversation_sessions = OrderedDict()  # session_id -> conversation, least recently active first
+conversation_lock = threading.Lock()
+
+def get_conversation(session_id):
+    with conversation_lock:
+        conversation = conversation_sessions.get(session_id)
+        if conversation is None:
+            conversation = {
+                "messages": deque(maxlen=HISTORY_MAX_MESSAGES),
+                "summary": "",
+                "evicted": [],  # evicted messages not yet folded into the summary, oldest first
+                "summary_lock": asyncio.Lock()
+            }
+            conversation_sessions[session_id] = conversation
+            if len(conversation_sessions) > MAX_SESSIONS:
+                conversation_sessions.popitem(last=False)
+        else:
+            conversation_sessions.move_to_end(session_id)
+        return conversation
+
+def record_turn(conversation, user_text, assistant_text):
+    with conversation_lock:
+        messages = conversation["messages"]
+        evicting = len(messages) + 2 > HISTORY_MAX_MESSAGES
+        if evicting:
+            conversation["evicted"].extend(messages.popleft() for _ in range(min(HISTORY_EVICT_MESSAGES, len(messages))))
+        messages.append({"role": "user", "content": user_text})
+        messages.append({"role": "assistant", "content": assistant_text})
+    if evicting:
+        task = asyncio.create_task(summarize_evicted(conversation))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+# --- OpenRouter: Fold evicted messages into the session's running summary ---
+# On failure the messages stay in conversation["evicted"] and are retried with the next eviction.
+async def summarize_evicted(conversation):
+    async with conversation["summary_lock"]:
+        with conversation_lock:
+            evicted = list(conversation["evicted"])
+        if not evicted:
+            return  # already folded in by an earlier task
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in evicted)
+        if conversation["summary"]:
+            transcript = f"Earlier summary: {conversation['summary']}\n{transcript}"
+        payload = {
+            "model": SUMMARY_MODEL,
+            "messages": [
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": transcript}
+            ],
+        }
+        headers = {
+            'Authorization': f'Bearer {OPENROUTER_API_KEY}',
+            'Content-Type': 'application/json',
+        }
+        try:
+            response = await post_with_retry(OPENROUTER_CHAT_URL, headers=headers, json_body=payload, timeout=60)
+            response.raise_for_status()
+            summary = (await response.json()).get('choices', [{}])[0].get('message', {}).get('content', '')
+        except Exception as e:
+            logging.error("Error summarizing conversation history: %s", e)
+            return
+        if not summary:
+            logging.error("Summarizing conversation history returned no content")
+            return
+        with conversation_lock:
+            conversation["summary"] = summary.strip()
+            del conversation["evicted"][:len(evicted)]
 
 # --- Helper: Read data.txt ---
 def read_data_txt():
     try:
         if not os.path.exists(DATA_FILE_PATH):
-            logging.warning(f"data.txt not found at {DATA_FILE_PATH}")
+            logging.warning("data.txt not found at %s", DATA_FILE_PATH)
             return "Error: Knowledge base file (data.txt) not found."
         with open(DATA_FILE_PATH, 'r', encoding='utf-8') as f:
             return f.read()
     except Exception as e:
-        logging.error(f"Error reading data.txt: {e}")
+        logging.error("Error reading data.txt: %s", e)
         return "Error: Could not load knowledge base due to an exception."
 
+# --- Audio level: duration and average dBFS of an uploaded recording ---
+def measure_audio_level(audio_bytes):
+    try:
+        # libsndfile decodes WAV/FLAC/OGG in-process, straight into int16 samples
+        samples, sample_rate = sf.read(io.BytesIO(audio_bytes), dtype='int16')
+        duration_sec = len(samples) / sample_rate
+        full_scale = 32768
+    except RuntimeError:
+        # Containers libsndfile can't read (e.g. the browser's WebM) go through ffmpeg
+        audio = AudioSegment.from_file(io.BytesIO(audio_bytes))
+        samples = np.array(audio.get_array_of_samples())
+        duration_sec = len(audio) / 1000.0
+        full_scale = 1 << (8 * audio.sample_width - 1)
+    if samples.size == 0:
+        return duration_sec, float('-inf')
+    rms = np.sqrt(np.mean(np.square(samples.astype(np.float32))))
+    avg_dbfs = 20 * np.log10(max(rms, 1e-9) / full_scale)
+    return duration_sec, float(avg_dbfs)
+
+# --- Sarvam TTS: At most TTS_MAX_CONCURRENCY calls in flight across all requests ---
+# Created once the event loop is running (see create_tts_semaphore)
+tts_semaphore = None
+
+@app.before_serving
+async def create_tts_semaphore():
+    global tts_semaphore
+    tts_semaphore = asyncio.Semaphore(TTS_MAX_CONCURRENCY)
+
+# --- Sarvam TTS: Convert one chunk, backing off on rate limits and server errors ---
+async def convert_tts_chunk(text):
+    for attempt in range(TTS_MAX_RETRIES + 1):
+        try:
+            async with tts_semaphore:
+                return await sarvam_client.text_to_speech.convert(
+                    text=text,
+                    target_language_code="hi-IN",
+                    speaker="hitesh",
+                    speech_sample_rate=24000,
+                    enable_preprocessing=True
+                )
+        except Exception as e:
+            status_code = getattr(e, 'status_code', None)
+            if attempt == TTS_MAX_RETRIES or status_code not in RETRYABLE_STATUS_CODES:
+                raise
+            delay = TTS_RETRY_BASE_DELAY * 2 ** attempt
+            logging.warning("TTS chunk failed with status %s, retrying in %.1f seconds", status_code, delay)
+            await asyncio.sleep(delay)
+
+# --- Split text into chunks for TTS API (e.g., 250 chars per chunk) ---
+# Whole sentences are packed greedily; strings are only built when a chunk is complete.
+def split_text(text, max_length=250):
+    chunks = []
+    current = []
+    current_len = 0
+    for sentence in SENTENCE_END_RE.split(text.strip()):
+        if not sentence:
+            continue
+        added_len = len(sentence) + (1 if current else 0)
+        if current and current_len + added_len >= max_length:
+            chunks.append(' '.join(current))
+            current.clear()
+            current_len = 0
+            added_len = len(sentence)
+        current.append(sentence)
+        current_len += added_len
+    if current:
+        chunks.append(' '.join(current))
+    return chunks
+
 # --- Sarvam TTS: Get base64 audio from API ---
-def get_tts_audio_base64(text):
-    # Split text into chunks for TTS API (e.g., 250 chars per chunk)
-    def split_text(text, max_length=250):
-        import re
-        sentences = re.split('(?<=[.!?]) +', text)
-        chunks = []
-        current = ''
-        for sentence in sentences:
-            if len(current) + len(sentence) < max_length:
-                current += ' ' + sentence
-            else:
-                if current:
-                    chunks.append(current.strip())
-                current = sentence
-        if current:
-            chunks.append(current.strip())
-        return chunks
-
-    sarvam = SarvamAI(api_subscription_key=SARVAM_API_KEY)
+async def get_tts_audio_base64(text):
     text_chunks = split_text(text)
-    audio_segments = []
-    for chunk in text_chunks:
-        tts_response = sarvam.text_to_speech.convert(
-            text=chunk,
-            target_language_code="hi-IN",
-            speaker="hitesh",
-            speech_sample_rate=24000,
-            enable_preprocessing=True
-        )
+    if not text_chunks:
+        return None
+    # Request all chunks concurrently; gather() keeps the responses in chunk order
+    tts_responses = await asyncio.gather(*(convert_tts_chunk(chunk) for chunk in text_chunks))
+    # All chunks come back as WAVs in the same format, so their PCM frames can be
+    # concatenated directly under a single new header without decoding.
+    params = None
+    pcm_frames = []
+    for tts_response in tts_responses:
         # tts_response.audios is a list of base64-encoded wavs
         for audio_b64 in tts_response.audios:
-            audio = AudioSegment.from_file(io.BytesIO(base64.b64decode(audio_b64)), format='wav')
-            audio_segments.append(audio)
-    if not audio_segments:
+            with wave.open(io.BytesIO(base64.b64decode(audio_b64)), 'rb') as wav:
+                params = params or wav.getparams()
+                pcm_frames.append(wav.readframes(wav.getnframes()))
+    if not pcm_frames:
         return None
-    combined = audio_segments[0]
-    for seg in audio_segments[1:]:
-        combined += seg
     buf = io.BytesIO()
-    combined.export(buf, format='wav')
+    with wave.open(buf, 'wb') as wav:
+        wav.setparams(params)
+        wav.writeframes(b''.join(pcm_frames))
     return base64.b64encode(buf.getvalue()).decode('utf-8')
 
 # --- Sarvam Translate: Translate text to Hindi ---
-def translate_to_telugu(text):
+async def translate_to_telugu(text):
     headers = {
         "api-subscription-key": SARVAM_API_KEY,
         "Content-Type": "application/json"
@@ -154,13 +386,13 @@ def translate_to_telugu(text):
         "target_language_code": "hi-IN",
         "mode": "code-mixed"
     }
-    response = requests.post("https://api.sarvam.ai/translate", json=payload, headers=headers)
+    response = await post_with_retry("https://api.sarvam.ai/translate", headers=headers, json_body=payload)
     response.raise_for_status()
-    data = response.json()
+    data = await response.json()
     return data.get('output', text)
 
 # --- Sarvam Translate: Translate text to English ---
-def translate_to_english(text):
+async def translate_to_english(text):
     headers = {
         "api-subscription-key": SARVAM_API_KEY,
         "Content-Type": "application/json"
@@ -171,36 +403,101 @@ def translate_to_english(text):
         "target_language_code": "en-IN",
         "mode": "classic-colloquial"
     }
-    response = requests.post("https://api.sarvam.ai/translate", json=payload, headers=headers)
+    response = await post_with_retry("https://api.sarvam.ai/translate", headers=headers, json_body=payload)
     response.raise_for_status()
-    data = response.json()
+    data = await response.json()
     return data.get('output', text)
 
+# --- Pipeline step: Translate one reply sentence and synthesize its audio ---
+async def speak_sentence(sentence):
+    translated_sentence = await translate_to_telugu(sentence)
+    return translated_sentence, await get_tts_audio_base64(translated_sentence)
+
+# --- OpenRouter: Yield content deltas from a streamed (SSE) chat completion ---
+async def iter_llm_deltas(llm_response):
+    async for raw_line in llm_response.content:
+        line = raw_line.decode('utf-8').strip()
+        # Skip blank separators and ": OPENROUTER PROCESSING" keep-alive comments
+        if not line or not line.startswith('data: '):
+            continue
+        data = line[len('data: '):]
+        if data == '[DONE]':
+            break
+        chunk = json.loads(data)
+        if 'error' in chunk:
+            raise RuntimeError(f"LLM stream error: {chunk['error']}")
+        delta = chunk.get('choices', [{}])[0].get('delta', {}).get('content')
+        if delta:
+            yield delta
+
+# --- Group streamed text into complete sentences as soon as each one ends ---
+async def iter_sentences(deltas):
+    buffer = ''
+    async for delta in deltas:
+        buffer += delta
+        *sentences, buffer = SENTENCE_END_RE.split(buffer)
+        for sentence in sentences:
+            if sentence.strip():
+                yield sentence.strip()
+    if buffer.strip():
+        yield buffer.strip()
+
+# --- Stream a reply from the response cache in the same shape as a fresh one ---
+async def replay_cached_reply(conversation, transcribed_text, translated_text, cached_reply, timings, start_time):
+    yield ndjson_line({
+        "type": "transcript",
+        "userTranscript": transcribed_text,
+        "translatedTranscript": translated_text
+    })
+    for event in cached_reply["audioEvents"]:
+        yield ndjson_line(event)
+    record_turn(conversation, translated_text, cached_reply["assistantReply"])
+    total_time = time.time() - start_time
+    logging.info("Total /api/transcribe-and-chat time: %.2f seconds (cached reply)", total_time)
+    yield ndjson_line({
+        "type": "done",
+        "assistantReply": cached_reply["assistantReply"],
+        "assistantReplyHindi": cached_reply["assistantReplyHindi"],
+        "timings": timings,
+        "totalTime": total_time,
+        "cached": True
+    })
+
+# --- Response cache key for a conversation state: a digest of its whole history and summary ---
+# Replies depend on everything said so far, so two sessions only share entries
+# when they got here the same way (in practice, on their first turn).
+def conversation_digest(history, summary):
+    state = json.dumps({"summary": summary, "messages": history}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(state.encode('utf-8')).hexdigest()
+
+def ndjson_line(event):
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
 # --- Main API endpoint ---
 @app.route('/api/transcribe-and-chat', methods=['POST'])
-def transcribe_and_chat():
-    global conversation_history
-
-    if 'audio' not in request.files:
+async def transcribe_and_chat():
+    files = await request.files
+    if 'audio' not in files:
         return jsonify({"error": "No audio file uploaded."}), 400
 
     if not SARVAM_API_KEY or not OPENROUTER_API_KEY:
         return jsonify({"error": "API keys not configured on the server."}), 500
 
-    audio_file = request.files['audio']
+    # Fall back to the client address for callers that don't send a session id
+    conversation = get_conversation(request.headers.get('X-Session-Id') or request.remote_addr)
+    audio_file = files['audio']
     audio_bytes = audio_file.read()
-    logging.info(f"Received audio file: {audio_file.filename}, size: {len(audio_bytes)} bytes")
+    logging.info("Received audio file: %s, size: %d bytes", audio_file.filename, len(audio_bytes))
 
-    # --- Silence detection using pydub ---
+    # --- Silence detection ---
+    loop = asyncio.get_running_loop()
     try:
-        audio = AudioSegment.from_file(io.BytesIO(audio_bytes))
-        duration_sec = len(audio) / 1000.0
-        avg_dbfs = audio.dBFS
-        logging.info(f"Audio duration: {duration_sec:.2f}s, avg dBFS: {avg_dbfs:.2f}")
+        duration_sec, avg_dbfs = await loop.run_in_executor(executor, measure_audio_level, audio_bytes)
+        logging.info("Audio duration: %.2fs, avg dBFS: %.2f", duration_sec, avg_dbfs)
         if duration_sec < 0.5 or avg_dbfs < -40:
             return jsonify({"error": "No valid speech detected (audio too short or too silent). Please try again with a clear question or statement."}), 400
     except Exception as e:
-        logging.error(f"Error processing audio for silence detection: {e}")
+        logging.error("Error processing audio for silence detection: %s", e)
         return jsonify({"error": "Could not process audio for silence detection.", "details": str(e)}), 400
 
     try:
@@ -208,99 +505,177 @@ def transcribe_and_chat():
         start_time = time.time()
         # --- 1. Transcription (Sarvam ASR) ---
         t0 = time.time()
-        files_asr = {
-            'file': (audio_file.filename or 'recording.wav', audio_bytes, audio_file.mimetype)
-        }
-        asr_payload = {
-            'model': 'saarika:v2',
-            'language_code': 'hi-IN'
-        }
+        def make_asr_form():
+            form = aiohttp.FormData()
+            form.add_field('file', audio_bytes, filename=audio_file.filename or 'recording.wav', content_type=audio_file.mimetype or None)
+            form.add_field('model', 'saarika:v2')
+            form.add_field('language_code', 'hi-IN')
+            return form
         headers_asr = {
             'api-subscription-key': SARVAM_API_KEY
         }
-        asr_response = requests.post(SARVAM_ASR_URL, files=files_asr, data=asr_payload, headers=headers_asr, timeout=60)
+        asr_response = await post_with_retry(SARVAM_ASR_URL, headers=headers_asr, make_form=make_asr_form, timeout=60)
         asr_response.raise_for_status()
-        asr_data = asr_response.json()
+        asr_data = await asr_response.json()
         transcribed_text = asr_data.get('transcript') or asr_data.get('text')
-        logging.info(f"Transcribed user input: {transcribed_text}")
+        logging.info("Transcribed user input: %s", transcribed_text)
         timings['asr'] = time.time() - t0
-        logging.info(f"ASR step took {timings['asr']:.2f} seconds")
+        logging.info("ASR step took %.2f seconds", timings['asr'])
         if not transcribed_text:
             return jsonify({"error": "Failed to transcribe audio. No transcript returned.", "details": asr_data}), 500
 
         # --- 2. Translate transcribed text to English ---
         t0 = time.time()
-        translated_text = translate_to_english(transcribed_text)
+        translated_text = await translate_to_english(transcribed_text)
         timings['translate_to_english'] = time.time() - t0
-        logging.info(f"Translate to English step took {timings['translate_to_english']:.2f} seconds")
+        logging.info("Translate to English step took %.2f seconds", timings['translate_to_english'])
+
+        # --- Response cache: the same question in the same conversation state replays its reply ---
+        with conversation_lock:
+            history = [*conversation["evicted"], *conversation["messages"]]
+            summary = conversation["summary"]
+        query_emb = await loop.run_in_executor(executor, embed_query, translated_text)
+        reply_context = conversation_digest(history, summary)
+        query_entities = response_cache.extract_entities(translated_text)
+        cached_reply = response_cache.lookup(query_emb, reply_context, query_entities)
+        if cached_reply is not None:
+            logging.info("Response cache hit for: %s", translated_text)
+            return Response(
+                replay_cached_reply(conversation, transcribed_text, translated_text, cached_reply, timings, start_time),
+                mimetype='application/x-ndjson'
+            )
 
         # --- 3. LLM (OpenRouter) ---
         t0 = time.time()
         # RAG: Retrieve relevant chunks for the query
-        relevant_chunks = retrieve(translated_text, rag_chunks, rag_embeddings, top_k=5)
-        rag_context = "\n\n".join(relevant_chunks)
-        current_system_prompt = f"{SYSTEM_PROMPT_BASE}\n\nRelevant knowledge base context from data.txt:\n{rag_context}"
+        rag_context = await loop.run_in_executor(executor, get_rag_context, translated_text)
+        # The static base prompt goes first, marked cacheable, so the provider can
+        # reuse its prefill; the per-request parts follow as separate blocks.
+        system_content = [
+            {"type": "text", "text": SYSTEM_PROMPT_BASE, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": f"Relevant knowledge base context from data.txt:\n{rag_context}"}
+        ]
+        if summary:
+            system_content.append({"type": "text", "text": f"Summary of the earlier conversation:\n{summary}"})
         messages_for_llm = [
-            {"role": "system", "content": current_system_prompt},
-            *conversation_history,
+            {"role": "system", "content": system_content},
+            *history,
             {"role": "user", "content": translated_text}
         ]
         llm_payload = {
-            "model": "google/gemini-2.0-flash-001",
+            "model": LLM_MODEL,
             "messages": messages_for_llm,
+            "stream": True,
         }
         headers_llm = {
             'Authorization': f'Bearer {OPENROUTER_API_KEY}',
             'Content-Type': 'application/json',
         }
-        llm_response = requests.post(OPENROUTER_CHAT_URL, json=llm_payload, headers=headers_llm)
+        llm_response = await post_with_retry(OPENROUTER_CHAT_URL, headers=headers_llm, json_body=llm_payload)
         llm_response.raise_for_status()
-        llm_data = llm_response.json()
-        assistant_reply = llm_data.get('choices', [{}])[0].get('message', {}).get('content', '')
-        timings['llm'] = time.time() - t0
-        logging.info(f"LLM step took {timings['llm']:.2f} seconds")
-        if not assistant_reply:
-            return jsonify({"error": "LLM did not return content.", "details": llm_data}), 500
 
-        # --- 4. Memory Management ---
-        conversation_history.append({"role": "user", "content": translated_text})
-        conversation_history.append({"role": "assistant", "content": assistant_reply})
+    except Exception as e:
+        logging.error("Error in /api/transcribe-and-chat: %s", e, exc_info=True)
+        return jsonify({"error": "An internal server error occurred.", "details": str(e)}), 500
 
-        # --- 5. Translate LLM reply to Telugu (for TTS) ---
-        t0 = time.time()
-        translated_reply = translate_to_telugu(assistant_reply)
-        timings['translate_to_telugu'] = time.time() - t0
-        logging.info(f"Translate to Telugu step took {timings['translate_to_telugu']:.2f} seconds")
-        logging.info(f"Output: {assistant_reply}")
+    # --- 4. Pipeline: LLM sentences -> translate -> TTS, streamed to the frontend as NDJSON ---
+    # A producer task reads the LLM stream and starts a translation + TTS task for each
+    # finished sentence; the response yields the audio in sentence order as soon as
+    # each one is ready, so playback starts while later sentences are still generating.
+    pending = asyncio.Queue()
+    reply_sentences = []
+
+    async def produce():
+        try:
+            async for sentence in iter_sentences(iter_llm_deltas(llm_response)):
+                reply_sentences.append(sentence)
+                pending.put_nowait(asyncio.create_task(speak_sentence(sentence)))
+            timings['llm'] = time.time() - t0
+            logging.info("LLM step took %.2f seconds", timings['llm'])
+            pending.put_nowait(None)
+        except Exception as e:
+            pending.put_nowait(e)
+        finally:
+            llm_response.release()
+
+    async def generate():
+        yield ndjson_line({
+            "type": "transcript",
+            "userTranscript": transcribed_text,
+            "translatedTranscript": translated_text
+        })
+        producer = asyncio.create_task(produce())
+        translated_sentences = []
+        audio_events = []
+        try:
+            while True:
+                item = await pending.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                translated_sentence, audio_base64 = await item
+                if 'first_audio' not in timings:
+                    timings['first_audio'] = time.time() - start_time
+                    logging.info("First audio ready after %.2f seconds", timings['first_audio'])
+                translated_sentences.append(translated_sentence)
+                audio_events.append({
+                    "type": "audio",
+                    "assistantReply": reply_sentences[len(translated_sentences) - 1],
+                    "assistantReplyHindi": translated_sentence,
+                    "audioBase64": audio_base64
+                })
+                yield ndjson_line(audio_events[-1])
+        except Exception as e:
+            logging.error("Error in /api/transcribe-and-chat: %s", e, exc_info=True)
+            yield ndjson_line({"type": "error", "error": "An internal server error occurred.", "details": str(e)})
+            return
+        finally:
+            # If the client went away or a step failed mid-reply, stop reading the LLM
+            # stream and cancel sentences still queued for translation + TTS, so they
+            # don't hold TTS slots for audio nobody will hear
+            producer.cancel()
+            while not pending.empty():
+                item = pending.get_nowait()
+                if isinstance(item, asyncio.Task):
+                    item.cancel()
+
+        assistant_reply = " ".join(reply_sentences)
+        if not assistant_reply:
+            yield ndjson_line({"type": "error", "error": "LLM did not return content."})
+            return
 
-        # --- 6. TTS (Sarvam) ---
-        t0 = time.time()
-        audio_base64 = get_tts_audio_base64(translated_reply)
-        timings['tts'] = time.time() - t0
-        logging.info(f"TTS step took {timings['tts']:.2f} seconds")
+        # --- 5. Memory Management ---
+        record_turn(conversation, translated_text, assistant_reply)
+        logging.info("Output: %s", assistant_reply)
+        response_cache.store(query_emb, reply_context, query_entities, {
+            "assistantReply": assistant_reply,
+            "assistantReplyHindi": " ".join(translated_sentences),
+            "audioEvents": audio_events
+        })
 
         total_time = time.time() - start_time
-        logging.info(f"Total /api/transcribe-and-chat time: {total_time:.2f} seconds")
+        logging.info("Total /api/transcribe-and-chat time: %.2f seconds", total_time)
 
-        # --- 7. Respond to frontend ---
-        return jsonify({
-            "userTranscript": transcribed_text,
-            "translatedTranscript": translated_text,
+        # --- 6. Finish the response ---
+        yield ndjson_line({
+            "type": "done",
             "assistantReply": assistant_reply,
-            "assistantReplyHindi": translated_reply,
-            "audioBase64": audio_base64,
+            "assistantReplyHindi": " ".join(translated_sentences),
             "timings": timings,
             "totalTime": total_time
         })
 
-    except Exception as e:
-        logging.error(f"Error in /api/transcribe-and-chat: {e}", exc_info=True)
-        return jsonify({"error": "An internal server error occurred.", "details": str(e)}), 500
+    body = generate()
+    # If the response is dropped before its body is iterated, generate() never runs
+    # and nothing else releases the LLM stream, so release it once the body is collected
+    weakref.finalize(body, llm_response.release)
+    return Response(body, mimetype='application/x-ndjson')
 
 # --- Health check endpoint ---
 @app.route('/', methods=['GET'])
-def serve_frontend():
-    return send_from_directory('static', 'index.html')
+async def serve_frontend():
+    return await send_from_directory(os.path.join(app.root_path, 'static'), 'index.html')
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=int(os.getenv('PORT', 5000)), debug=True)
\ No newline at end of file
@@ -1,37 +1,316 @@
 import os
 import json
+import time
+import queue
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+import torch
 from sentence_transformers import SentenceTransformer
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 import numpy as np
 
-# Load embedding model once
-embedder = SentenceTransformer('all-mpnet-base-v2')
+# FAISS is preferred; without it retrieval falls back to an exhaustive scan,
+# JIT-compiled with Numba when that is installed
+try:
+    import faiss
+except ImportError:
+    faiss = None
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Embedding model, loaded once on first use
+# (MiniLM: 384-dim vectors, about 3x faster to encode than 768-dim MPNet)
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+_embedder = None
+_embedder_lock = threading.Lock()
+
+# Queries are embedded by a background worker that groups queries arriving within
+# QUERY_BATCH_WAIT seconds of each other (up to QUERY_BATCH_SIZE) into one forward pass
+QUERY_BATCH_SIZE = 16
+QUERY_BATCH_WAIT = 0.005
+# Upper bound on waiting for a query embedding, including a first-use model load
+QUERY_EMBED_TIMEOUT = 60
+_query_queue = queue.Queue()
+
+# Chunk embeddings are cached on disk per model: one .npy per chunk keyed by the
+# SHA-256 of its text, plus the stacked matrix of the whole corpus so a warm start
+# with unchanged data is a single file load. Files for chunks no longer in the
+# corpus are pruned whenever the corpus matrix is rebuilt.
+EMB_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'emb_cache', EMBEDDING_MODEL.replace('/', '__'))
+# Temp files older than this were left by a writer that died before renaming them
+STALE_TMP_AGE = 3600
+
+# Chunk vectors are stored as 8-bit scalar-quantized codes, a quarter of the
+# bytes of float32 per scan. Above IVF_THRESHOLD chunks an exhaustive scan gets
+# slow, so the codes are split into inverted lists and only IVF_NPROBE are scanned.
+IVF_THRESHOLD = 100_000
+IVF_NPROBE = 8
+
+# Approximate query cache: a query whose cosine similarity to a cached query is
+# at least QUERY_CACHE_THRESHOLD reuses that query's top-k chunk indices instead
+# of searching the index again. Least recently used entries are evicted first.
+QUERY_CACHE_THRESHOLD = 0.97
+QUERY_CACHE_SIZE = 512
+_cache_lock = threading.Lock()
+_cache_keys = None  # (QUERY_CACHE_SIZE, dim) normalized query embeddings, one row per slot
+_cache_vals = OrderedDict()  # slot -> top-k chunk indices, least recently used first
+
+def _get_embedder():
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            # Leave cores for concurrent requests instead of oversubscribing BLAS threads
+            torch.set_num_threads(max(1, (os.cpu_count() or 2) // 2))
+            _embedder = SentenceTransformer(EMBEDDING_MODEL)
+        return _embedder
+
+def _embed_queries_worker():
+    # Load the model in the background so it's ready for the first query. If that
+    # fails, the load is retried per batch below and the error reaches the callers.
+    try:
+        _get_embedder()
+    except Exception:
+        pass
+    while True:
+        batch = [_query_queue.get()]
+        deadline = time.monotonic() + QUERY_BATCH_WAIT
+        while len(batch) < QUERY_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(_query_queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        try:
+            embeddings = _get_embedder().encode(
+                [query for query, _ in batch],
+                batch_size=QUERY_BATCH_SIZE,
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            )
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            continue
+        for (_, future), embedding in zip(batch, embeddings):
+            future.set_result(embedding)
+
+threading.Thread(target=_embed_queries_worker, name='query-embedder', daemon=True).start()
+
+# Embed a single query (L2-normalized), batched with any concurrent queries.
+# Memoized: a request looks up the same query text for several caches.
+
+@functools.lru_cache(maxsize=256)
+def embed_query(query):
+    future = Future()
+    _query_queue.put((query, future))
+    return future.result(timeout=QUERY_EMBED_TIMEOUT)
 
 # Load and chunk data.txt
-# Each chunk is a string of up to chunk_size characters
+# Each chunk is a string of up to chunk_size characters, split on paragraph, line
+# and sentence boundaries where possible, overlapping its neighbour by chunk_overlap
 
-def load_and_chunk_data(file_path, chunk_size=1000):
+def load_and_chunk_data(file_path, chunk_size=1000, chunk_overlap=100):
     with open(file_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", ". ", " ", ""],
+        # Keep each full stop on the sentence it ends, not the start of the next chunk
+        keep_separator="end"
+    )
     chunks = []
     for entry in data:
         for value in entry['content'].values():
             # Split long text into smaller chunks
-            for i in range(0, len(value), chunk_size):
-                chunk = value[i:i+chunk_size]
+            for chunk in splitter.split_text(value):
                 if chunk.strip():
                     chunks.append(chunk)
     return chunks
 
-# Compute embeddings for all chunks
+# Load embeddings for all chunks from the on-disk cache, encoding only the misses
+
+def load_embeddings(chunks):
+    os.makedirs(EMB_CACHE_DIR, exist_ok=True)
+    _remove_stale_tmp_files()
+    keys = [hashlib.sha256(chunk.encode('utf-8')).hexdigest() for chunk in chunks]
+    corpus_key = hashlib.sha256(''.join(keys).encode('utf-8')).hexdigest()
+    corpus_path = os.path.join(EMB_CACHE_DIR, f'corpus_{corpus_key}.npy')
+    if os.path.exists(corpus_path):
+        # Copy out of the memmap: the index normalizes and stores its own vectors
+        return np.array(np.load(corpus_path, mmap_mode='r'), dtype=np.float32)
+
+    embeddings = [None] * len(chunks)
+    misses = []
+    for i, key in enumerate(keys):
+        path = os.path.join(EMB_CACHE_DIR, f'{key}.npy')
+        if os.path.exists(path):
+            embeddings[i] = np.load(path)
+        else:
+            misses.append(i)
+    if misses:
+        encoded = _get_embedder().encode(
+            [chunks[i] for i in misses],
+            batch_size=64,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        for i, vector in zip(misses, encoded):
+            _save_atomic(os.path.join(EMB_CACHE_DIR, f'{keys[i]}.npy'), vector)
+            embeddings[i] = vector
+
+    matrix = np.ascontiguousarray(np.stack(embeddings), dtype=np.float32)
+    _save_atomic(corpus_path, matrix)
+    # Only the current corpus matrix and its chunks' vectors are worth keeping around
+    keep = {f'{key}.npy' for key in keys}
+    keep.add(os.path.basename(corpus_path))
+    for name in os.listdir(EMB_CACHE_DIR):
+        if name.endswith('.npy') and name not in keep:
+            _remove_quietly(os.path.join(EMB_CACHE_DIR, name))
+    return matrix
+
+def _remove_stale_tmp_files():
+    now = time.time()
+    for name in os.listdir(EMB_CACHE_DIR):
+        if not name.endswith('.tmp'):
+            continue
+        path = os.path.join(EMB_CACHE_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > STALE_TMP_AGE:
+                _remove_quietly(path)
+        except FileNotFoundError:
+            pass  # renamed into place meanwhile
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass  # another worker got there first
+
+# Write an array to a temp file and rename it into place, so a crash or a
+# concurrent writer never leaves a truncated .npy behind
+
+def _save_atomic(path, array):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+# Index the chunk embeddings for inner-product search.
+# Vectors are L2-normalized once here, so inner product == cosine similarity.
 
 def build_index(chunks):
-    embeddings = embedder.encode(chunks, convert_to_numpy=True)
-    return chunks, embeddings
+    embeddings = load_embeddings(chunks)
+    if faiss is not None:
+        index = _build_faiss_index(embeddings)
+    else:
+        index = _DenseIndex(embeddings)
+    # Cached indices point into the previous chunk list
+    with _cache_lock:
+        _cache_vals.clear()
+    return chunks, index
+
+def _build_faiss_index(embeddings):
+    faiss.normalize_L2(embeddings)
+    dim = embeddings.shape[1]
+    if len(embeddings) > IVF_THRESHOLD:
+        nlist = int(4 * np.sqrt(len(embeddings)))
+        index = faiss.IndexIVFScalarQuantizer(
+            faiss.IndexFlatIP(dim), dim, nlist,
+            faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+        )
+        index.nprobe = IVF_NPROBE
+    else:
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    index.train(embeddings)
+    index.add(embeddings)
+    return index
+
+# Exhaustive cosine-similarity index used when FAISS isn't installed. It has the
+# same search() interface as a FAISS index, so retrieve() works with either.
+# Rows are L2-normalized once here, so a score is a plain dot product. Without
+# Numba the matrix is stored as float16 (half the bytes to scan) and upcast to
+# float32 DENSE_BLOCK_ROWS rows at a time so the products still run through BLAS.
+# Blocks are kept small enough for the float32 copy to stay in L2 cache; a
+# larger one would be written out and re-read, costing more than float32 storage.
+
+DENSE_BLOCK_ROWS = 256
+
+class _DenseIndex:
+    def __init__(self, embeddings):
+        embeddings = embeddings / (np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-8)
+        dtype = np.float32 if numba is not None else np.float16
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=dtype)
+
+    def search(self, query_embs, k):
+        query = query_embs[0] / (np.linalg.norm(query_embs[0]) + 1e-8)
+        query = np.ascontiguousarray(query, dtype=np.float32)
+        if numba is not None:
+            scores = _dot_scores(self.embeddings, query)
+        else:
+            scores = np.empty(len(self.embeddings), dtype=np.float32)
+            block = np.empty((DENSE_BLOCK_ROWS, self.embeddings.shape[1]), dtype=np.float32)
+            for start in range(0, len(self.embeddings), DENSE_BLOCK_ROWS):
+                rows = self.embeddings[start:start + DENSE_BLOCK_ROWS]
+                np.copyto(block[:len(rows)], rows)
+                np.dot(block[:len(rows)], query, out=scores[start:start + len(rows)])
+        # O(N) selection of the k best, then sort just those k by score
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return scores[top][None, :], top[None, :]
+
+if numba is not None:
+    # Dot product of every row with the query, in one parallel pass over the matrix
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _dot_scores(embeddings, query):
+        scores = np.empty(embeddings.shape[0], dtype=np.float32)
+        for i in numba.prange(embeddings.shape[0]):
+            s = 0.0
+            for j in range(embeddings.shape[1]):
+                s += embeddings[i, j] * query[j]
+            scores[i] = s
+        return scores
+
+def _cache_lookup(query_emb, top_k):
+    with _cache_lock:
+        if not _cache_vals:
+            return None
+        sims = _cache_keys[:len(_cache_vals)] @ query_emb
+        slot = int(np.argmax(sims))
+        if sims[slot] < QUERY_CACHE_THRESHOLD or len(_cache_vals[slot]) < top_k:
+            return None
+        _cache_vals.move_to_end(slot)
+        return _cache_vals[slot][:top_k]
+
+def _cache_insert(query_emb, indices):
+    global _cache_keys
+    with _cache_lock:
+        if _cache_keys is None or _cache_keys.shape[1] != query_emb.shape[0]:
+            _cache_keys = np.empty((QUERY_CACHE_SIZE, query_emb.shape[0]), dtype=np.float32)
+            _cache_vals.clear()
+        if len(_cache_vals) >= QUERY_CACHE_SIZE:
+            slot, _ = _cache_vals.popitem(last=False)
+        else:
+            slot = len(_cache_vals)
+        _cache_keys[slot] = query_emb
+        _cache_vals[slot] = indices
 
 # Retrieve top-N relevant chunks for a query
 
-def retrieve(query, chunks, embeddings, top_k=5):
-    query_emb = embedder.encode([query], convert_to_numpy=True)[0]
-    scores = np.dot(embeddings, query_emb) / (np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query_emb) + 1e-8)
-    top_indices = np.argsort(scores)[-top_k:][::-1]
-    return [chunks[i] for i in top_indices] 
\ No newline at end of file
+def retrieve(query, chunks, index, top_k=5):
+    query_emb = np.ascontiguousarray(embed_query(query), dtype=np.float32).reshape(1, -1)
+    top_k = min(top_k, len(chunks))
+    top_indices = _cache_lookup(query_emb[0], top_k)
+    if top_indices is None:
+        _, found = index.search(query_emb, top_k)
+        top_indices = [int(i) for i in found[0] if i >= 0]
+        _cache_insert(query_emb[0], top_indices)
+    return [chunks[i] for i in top_indices]
@@ -0,0 +1,109 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Response-level semantic cache: maps an English query to a finished reply (text and
+# audio) so a repeated question skips RAG, the LLM, translation and TTS entirely.
+# Entries are partitioned by conversation context and query entities; every entry in
+# the matching partition is compared, and the most similar cached query is reused if
+# its cosine similarity reaches RESPONSE_CACHE_THRESHOLD. Entries expire after
+# RESPONSE_CACHE_TTL seconds, and the oldest are evicted beyond RESPONSE_CACHE_SIZE.
+RESPONSE_CACHE_THRESHOLD = 0.93
+RESPONSE_CACHE_TTL = 3600
+RESPONSE_CACHE_SIZE = 1024
+
+_lock = threading.Lock()
+_partitions = {}  # (context, entities) -> list of entry ids
+_entries = OrderedDict()  # entry id -> (partition key, embedding, payload, timestamp), oldest first
+_next_id = 0
+
+# Budgets, BHK counts and areas, e.g. "1.5 crore", "2BHK", "1200 sq. ft"
+_UNIT_PATTERN = r"bhk|crores?|cr|lakhs?|lacs?|sq\.?\s*ft"
+_QUANTITY_RE = re.compile(rf"\b(\d+(?:\.\d+)?)\s*(?:({_UNIT_PATTERN})\b)?", re.IGNORECASE)
+# Spelled-out numbers, rewritten as digits before quantities are extracted. The
+# Hindi ones are also common English words ("do", "das"), so they only count
+# when a unit follows.
+_NUMBER_WORDS = {
+    'one': '1', 'two': '2', 'three': '3', 'four': '4', 'five': '5',
+    'six': '6', 'seven': '7', 'eight': '8', 'nine': '9', 'ten': '10',
+}
+_HINDI_NUMBER_WORDS = {
+    'ek': '1', 'do': '2', 'teen': '3', 'char': '4', 'chaar': '4', 'paanch': '5',
+    'panch': '5', 'chhe': '6', 'chhah': '6', 'saat': '7', 'aath': '8', 'nau': '9', 'das': '10',
+}
+_NUMBER_WORD_RE = re.compile(
+    rf"\b(?:({'|'.join(_NUMBER_WORDS)})\b|({'|'.join(_HINDI_NUMBER_WORDS)})\b(?=\s*(?:{_UNIT_PATTERN})\b))",
+    re.IGNORECASE
+)
+_TOKEN_RE = re.compile(r"[A-Za-z]+|[.!?](?=\s|$)")
+_UNIT_ALIASES = {
+    'crore': 'cr', 'crores': 'cr', 'cr': 'cr',
+    'lakh': 'lakh', 'lakhs': 'lakh', 'lac': 'lakh', 'lacs': 'lakh',
+}
+_UNIT_WORDS = {'bhk', 'sq', 'ft', *_UNIT_ALIASES}
+
+# Entities in a query that must match exactly for a cached reply to be reused,
+# so that e.g. "2 BHK in Gurgaon" and "3 BHK in Noida" never share an entry
+# however similar their embeddings are
+
+def _number_word_to_digits(match):
+    english, hindi = match.groups()
+    if english:
+        return _NUMBER_WORDS[english.lower()]
+    return _HINDI_NUMBER_WORDS[hindi.lower()]
+
+def extract_entities(text):
+    entities = set()
+    text = _NUMBER_WORD_RE.sub(_number_word_to_digits, text)
+    for number, unit in _QUANTITY_RE.findall(text):
+        unit = unit.lower().replace('.', '').replace(' ', '')
+        entities.add(number + _UNIT_ALIASES.get(unit, unit))
+    # Capitalized words not starting a sentence: localities, project names
+    sentence_start = True
+    for token in _TOKEN_RE.findall(text):
+        if token in '.!?':
+            sentence_start = True
+            continue
+        if not sentence_start and token[0].isupper() and token.lower() not in _UNIT_WORDS:
+            entities.add(token.lower())
+        sentence_start = False
+    return tuple(sorted(entities))
+
+def _remove(entry_id):
+    key, _, _, _ = _entries.pop(entry_id)
+    partition = _partitions[key]
+    partition.remove(entry_id)
+    if not partition:
+        del _partitions[key]
+
+# Look up a cached reply for an L2-normalized query embedding. context identifies
+# the conversation state the reply was given in (e.g. a digest of the full history).
+
+def lookup(query_emb, context, entities):
+    now = time.time()
+    with _lock:
+        best_payload, best_sim = None, RESPONSE_CACHE_THRESHOLD
+        for entry_id in list(_partitions.get((context, entities), ())):
+            _, embedding, payload, timestamp = _entries[entry_id]
+            if now - timestamp > RESPONSE_CACHE_TTL:
+                _remove(entry_id)
+                continue
+            if embedding.shape != query_emb.shape:
+                continue
+            sim = float(embedding @ query_emb)
+            if sim >= best_sim:
+                best_payload, best_sim = payload, sim
+        return best_payload
+
+def store(query_emb, context, entities, payload):
+    global _next_id
+    with _lock:
+        key = (context, entities)
+        entry_id = _next_id
+        _next_id += 1
+        _entries[entry_id] = (key, np.array(query_emb, dtype=np.float32), payload, time.time())
+        _partitions.setdefault(key, []).append(entry_id)
+        while len(_entries) > RESPONSE_CACHE_SIZE:
+            _remove(next(iter(_entries)))
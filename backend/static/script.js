@@ -11,6 +11,10 @@ document.addEventListener('DOMContentLoaded', () => {
     let isRecording = false;
     let audioContext, analyser, sourceNode, silenceTimer, stream;
     const BACKEND_URL = 'http://localhost:5001/api/transcribe-and-chat'; // Ensure this matches your Python backend port
+    // Identifies this page's conversation so the backend keeps a separate history per user
+    const SESSION_ID = window.crypto && crypto.randomUUID
+        ? crypto.randomUUID()
+        : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
 
     // --- UI Update Functions ---
     function updateStatus(message) {
@@ -136,6 +140,77 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // --- Reply Playback ---
+    // Plays streamed audio chunks back to back in arrival order, then resumes listening
+    function createReplyPlayer() {
+        const queue = [];
+        let playing = false;
+        let streamDone = false;
+        let finished = false;
+        let hadAudio = false;
+
+        function finish() {
+            if (finished) return;
+            finished = true;
+            if (hadAudio) {
+                micButton.disabled = false; // Re-enable mic button after speaking
+                if (isSessionActive) {
+                    micButton.textContent = '🎤 Mic Off (Listening...)';
+                    micButton.classList.add('recording');
+                    updateStatus('Listening... Speak now.');
+                    startRecordingWithSilenceDetection();
+                }
+            } else if (isSessionActive) {
+                // If no audio, auto-restart listening
+                setTimeout(() => startRecordingWithSilenceDetection(), 1000);
+            }
+        }
+
+        function playNext() {
+            if (finished) return;
+            if (queue.length === 0) {
+                playing = false;
+                if (streamDone) finish();
+                return;
+            }
+            playing = true;
+            const audio = new Audio('data:audio/wav;base64,' + queue.shift());
+            // A broken clip can fire both onerror and the play() rejection; advance only once
+            let advanced = false;
+            const advance = () => {
+                if (advanced) return;
+                advanced = true;
+                playNext();
+            };
+            audio.onended = advance;
+            audio.onerror = advance;
+            audio.play().catch(advance);
+        }
+
+        return {
+            enqueue(audioBase64) {
+                if (finished) return;
+                if (!hadAudio) {
+                    hadAudio = true;
+                    updateStatus('Playing assistant reply...');
+                    micButton.textContent = '🔈 Assistant Speaking';
+                    micButton.classList.remove('recording');
+                    micButton.disabled = true; // Disable mic button while speaking
+                }
+                queue.push(audioBase64);
+                if (!playing) playNext();
+            },
+            end() {
+                streamDone = true;
+                if (!playing) finish();
+            },
+            abort() {
+                finished = true;
+                queue.length = 0;
+            }
+        };
+    }
+
     // --- Backend Communication ---
     async function sendAudioToBackend(audioBlob) {
         const formData = new FormData();
@@ -148,6 +223,7 @@ document.addEventListener('DOMContentLoaded', () => {
         try {
             const response = await fetch(BACKEND_URL, {
                 method: 'POST',
+                headers: { 'X-Session-Id': SESSION_ID },
                 body: formData
             });
 
@@ -156,39 +232,42 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error(`Backend error: ${response.status} ${response.statusText}. Details: ${JSON.stringify(errorData.details || errorData.error)}`);
             }
 
-            const result = await response.json();
-
-            displayTranscription(result.userTranscript);
-            displayAssistantResponse(result.assistantReply);
-            addToConversationLog('user', result.translatedTranscript);
-            addToConversationLog('assistant', result.assistantReply);
-            updateStatus('Playing assistant reply...');
-
-            // Play Sarvam TTS audio if available as base64
-            if (result.audioBase64) {
-                let audio = new Audio('data:audio/wav;base64,' + result.audioBase64);
-                updateStatus('Playing assistant reply...');
-                micButton.textContent = '🔈 Assistant Speaking';
-                micButton.classList.remove('recording');
-                micButton.disabled = true; // Disable mic button while speaking
-                audio.onended = () => {
-                    micButton.disabled = false; // Re-enable mic button after speaking
-                    if (isSessionActive) {
-                        micButton.textContent = '🎤 Mic Off (Listening...)';
-                        micButton.classList.add('recording');
-                        updateStatus('Listening... Speak now.');
-                        startRecordingWithSilenceDetection();
+            // The reply streams back as NDJSON: the transcript first, then one audio
+            // event per sentence as soon as it is synthesized, then a final 'done' event.
+            const player = createReplyPlayer();
+            let replyText = '';
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffered = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffered += decoder.decode(value, { stream: true });
+                const lines = buffered.split('\n');
+                buffered = lines.pop();
+                for (const line of lines) {
+                    if (!line.trim()) continue;
+                    const event = JSON.parse(line);
+                    if (event.type === 'transcript') {
+                        displayTranscription(event.userTranscript);
+                        addToConversationLog('user', event.translatedTranscript);
+                    } else if (event.type === 'audio') {
+                        replyText = replyText ? `${replyText} ${event.assistantReply}` : event.assistantReply;
+                        displayAssistantResponse(replyText);
+                        if (event.audioBase64) player.enqueue(event.audioBase64);
+                    } else if (event.type === 'done') {
+                        displayAssistantResponse(event.assistantReply);
+                        addToConversationLog('assistant', event.assistantReply);
+                    } else if (event.type === 'error') {
+                        player.abort();
+                        throw new Error(`Backend error. Details: ${JSON.stringify(event.details || event.error)}`);
                     }
-                };
-                audio.play();
-            } else {
-                // If no audio, auto-restart listening
-                if (isSessionActive) {
-                    setTimeout(() => startRecordingWithSilenceDetection(), 1000);
                 }
             }
+            player.end();
         } catch (err) {
             console.error('Error sending audio to backend:', err);
+            micButton.disabled = false;
             updateStatus(`Error: ${err.message}`);
             assistantResponseDiv.innerHTML = `<strong style="color:red;">Error:</strong> ${err.message}`;
             // Auto-restart listening if session is active